@@ -1,16 +1,18 @@
 #!/usr/bin/env python3
 
+import hashlib
 import os
+import re
 import subprocess
 import threading
 import traceback
 
-from collections import OrderedDict
-from steamfiles import acf
 from tkinter import filedialog
 from tkinter import messagebox
+from tkinter import ttk
 from tkinter import *
 
+import ui.config
 import ui.header
 import ui.database
 import ui.launcher
@@ -20,9 +22,12 @@ import loader.extract
 import loader.load
 
 import version
-import winreg
 import platform
 
+winreg = None
+if platform.system() == "Windows":
+    import winreg
+
 POSSIBLE_SPACEHAVEN_LOCATIONS = [
     # MacOS
     "/Applications/spacehaven.app",
@@ -47,6 +52,73 @@ POSSIBLE_SPACEHAVEN_LOCATIONS = [
 ]
 DatabaseHandler = ui.database.ModDatabase
 
+def steam_library_paths(library_folders):
+    """List the library paths from a parsed libraryfolders.vdf"""
+    # older Steam versions use "LibraryFolders" with "1": "path" entries,
+    # newer ones use "libraryfolders" with "1": { "path": "path", ... } entries
+    folders = library_folders.get("libraryfolders") or library_folders.get("LibraryFolders") or {}
+    paths = []
+    for key, value in folders.items():
+        if not str.isnumeric(key):
+            continue
+        if isinstance(value, dict):
+            value = value.get("path")
+        if value:
+            paths.append(value)
+    return paths
+
+def find_steam_install_path():
+    """Get the Steam installation folder from the Windows registry"""
+    # the per-user key is always there for the current Steam install, and doesn't depend on 32/64-bit
+    try:
+        with winreg.OpenKey(winreg.HKEY_CURRENT_USER, "Software\\Valve\\Steam") as key:
+            return os.path.normpath(winreg.QueryValueEx(key, "SteamPath")[0])
+    except FileNotFoundError:
+        pass
+    
+    for registry_path in ("SOFTWARE\\WOW6432Node\\Valve\\Steam", "SOFTWARE\\Valve\\Steam"):
+        try:
+            with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, registry_path) as key:
+                return winreg.QueryValueEx(key, "InstallPath")[0]
+        except FileNotFoundError:
+            pass
+    raise FileNotFoundError("No Steam registry key found")
+
+VDF_PATH_PATTERN = re.compile(rb'"path"\s+"([^"]+)"')
+
+def read_steam_library_paths(vdf_path):
+    """List the library paths from a libraryfolders.vdf file"""
+    # only the "path" values are needed, a regex is much cheaper than the full VDF parser
+    with open(vdf_path, 'rb') as f:
+        data = f.read()
+    paths = [path.decode('utf-8').replace('\\\\', '\\') for path in VDF_PATH_PATTERN.findall(data)]
+    if paths:
+        return paths
+    
+    # older format without "path" keys, only needed there
+    from collections import OrderedDict
+    from steamfiles import acf
+    with open(vdf_path, 'r') as f:
+        return steam_library_paths(acf.load(f, wrapper=OrderedDict))
+
+def existing_locations(locations):
+    """Yield the locations that exist, in order, listing each parent folder only once"""
+    # most candidates share a few parent folders that usually don't exist: one listdir per
+    # parent instead of one stat per candidate. Names are matched case-insensitively for
+    # Windows and MacOS, and the name found on disk is yielded.
+    listings = {}
+    for location in locations:
+        parent, name = os.path.split(os.path.abspath(location))
+        if parent not in listings:
+            try:
+                listings[parent] = {entry.lower(): entry for entry in os.listdir(parent)}
+            except OSError:
+                listings[parent] = {}
+        found = listings[parent].get(name.lower())
+        if found:
+            yield os.path.join(parent, found)
+
+
 class Window(Frame):
     def __init__(self, master=None):
         Frame.__init__(self, master)
@@ -54,6 +126,7 @@ class Window(Frame):
 
         self.master.title("Space Haven Mod Loader v{}".format(version.version))
         self.master.bind('<FocusIn>', self.focus)
+        self.master.bind('<<BackgroundDone>>', self.on_background_done)
 
         self.headerImage = PhotoImage(data=ui.header.image, width=1680, height=30)
         self.header = Label(self.master, bg='black', image=self.headerImage)
@@ -72,8 +145,13 @@ class Window(Frame):
         
         # left side mods list
         self.modListFrame = Frame(self.modBrowser)
-        self.modList = Listbox(self.modListFrame, height=0, selectmode=SINGLE, activestyle = NONE)
-        self.modList.bind('<<ListboxSelect>>', self.showCurrentMod)
+        # Treeview rather than Listbox: colors come from tags set at insert time, no per-item config
+        style = ttk.Style(self.master)
+        style.map('ModList.Treeview', background = [('selected', 'lightblue')])
+        self.modList = ttk.Treeview(self.modListFrame, show='tree', selectmode='browse', style='ModList.Treeview')
+        self.modList.tag_configure('enabled', foreground = 'black')
+        self.modList.tag_configure('disabled', foreground = 'grey')
+        self.modList.bind('<<TreeviewSelect>>', self.showCurrentMod)
         self.modList.pack(fill=BOTH, expand=1, padx=4, pady=4)
 
         self.modListFrame.pack(side=LEFT, fill=Y, padx=4, pady=4)
@@ -152,37 +230,37 @@ class Window(Frame):
         self.jarPath = None
         self.modPath = None
         
+        self.settings = ui.config.Config()
+        
         # Open previous location if known
-        try:
-            with open("previous_spacehaven_path.txt", 'r') as f:
-                location = f.read()
-                if os.path.exists(location):
-                    self.locateSpacehaven(location)
-                    return
-        except FileNotFoundError:
-            ui.log.log("Unable to get last space haven location. Autolocating again.")
+        location = self.settings.gamePath
+        if location and os.path.exists(location):
+            self.locateSpacehaven(location)
+            return
+        ui.log.log("Unable to get last space haven location. Autolocating again.")
         
         # Steam based locator (Windows)
-        try:
-            registry_path = "SOFTWARE\\WOW6432Node\\Valve\\Steam" if (platform.architecture()[0] == "64bit") else "SOFTWARE\\Valve\\Steam"
-            steam_path = winreg.QueryValueEx(winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, registry_path), "InstallPath")[0]
-            library_folders = acf.load(open(steam_path + "\\steamapps\\libraryfolders.vdf"), wrapper=OrderedDict)
-            locations = [steam_path + "\\steamapps\\common\\SpaceHaven\\spacehaven.exe"]
-            for key, value in library_folders["LibraryFolders"].items():
-                if str.isnumeric(key): locations.append(value + "\\steamapps\\common\\SpaceHaven\\spacehaven.exe")
-            for location in locations:
-                if os.path.exists(location):
-                    self.locateSpacehaven(location)
-                    return
-        except FileNotFoundError:
-            ui.log.log("Unable to locate Steam registry keys, aborting Steam autolocator")
-
-        for location in POSSIBLE_SPACEHAVEN_LOCATIONS:
-            try: 
-                location = os.path.abspath(location)
-                if os.path.exists(location):
-                    self.locateSpacehaven(location)
-                    return
+        if winreg is not None:
+            try:
+                steam_path = self.settings.steamInstallPath
+                if not steam_path or not os.path.exists(steam_path):
+                    steam_path = find_steam_install_path()
+                    self.settings.steamInstallPath = steam_path
+                    self.settings.save()
+                locations = [steam_path + "\\steamapps\\common\\SpaceHaven\\spacehaven.exe"]
+                for library_path in read_steam_library_paths(steam_path + "\\steamapps\\libraryfolders.vdf"):
+                    locations.append(library_path + "\\steamapps\\common\\SpaceHaven\\spacehaven.exe")
+                for location in locations:
+                    if os.path.exists(location):
+                        self.locateSpacehaven(location)
+                        return
+            except FileNotFoundError:
+                ui.log.log("Unable to locate Steam registry keys, aborting Steam autolocator")
+
+        for location in existing_locations(POSSIBLE_SPACEHAVEN_LOCATIONS):
+            try:
+                self.locateSpacehaven(location)
+                return
             except:
                 pass
         ui.log.log("Unable to autolocate installation. User will need to pick manually.")
@@ -216,8 +294,8 @@ class Window(Frame):
         ui.log.log("  jarPath: {}".format(self.jarPath))
         
         
-        with open("previous_spacehaven_path.txt", 'w') as f:
-            f.write(path)
+        self.settings.gamePath = path
+        self.settings.save()
         
         self.checkForLoadedMods()
 
@@ -226,14 +304,7 @@ class Window(Frame):
         self.spacehavenText.delete(0, 'end')
         self.spacehavenText.insert(0, self.gamePath)
         
-        self.modPath = [self.modPath, ]
-        try:
-            with open("extra_mods_path.txt", 'r') as f:
-                for mod_path in f.read().split('\n'):
-                    if mod_path.strip():
-                        self.modPath.append(mod_path.strip())
-        except:
-            pass
+        self.modPath = [self.modPath, ] + self.settings.extraModPaths
         
         DatabaseHandler(self.modPath, self.gameInfo)
         self.refreshModList()
@@ -245,8 +316,6 @@ class Window(Frame):
         loader.load.unload(self.jarPath)
 
     def browseForSpacehaven(self):
-        import platform
-        
         filetypes = []
         if platform.system() == "Windows":
             filetypes.append(('spacehaven.exe', '*.exe'))
@@ -268,6 +337,9 @@ class Window(Frame):
         #self.refreshModList()
         pass
 
+    mod_list_batch_size = 32
+    _pending_mod_batch = None
+
     def refreshModList(self):
         try:
             # might fail at init time
@@ -275,43 +347,77 @@ class Window(Frame):
         except:
             previously_selected = None
             pass
-        self.modList.delete(0, END)
+        if self._pending_mod_batch is not None:
+            # a previous refresh is still filling the list
+            self.after_cancel(self._pending_mod_batch)
+            self._pending_mod_batch = None
+        self.modList.delete(*self.modList.get_children())
 
         if self.modPath is None:
             self.showModError("Spacehaven not found", "Please use the 'Find game' button below to locate Spacehaven.")
             return
 
-        DatabaseHandler.getInstance().locateMods()
+        # reading mod folders and info files can be slow (network drives...), keep the UI responsive
+        self.start_background_task(
+            DatabaseHandler.getInstance().locateMods,
+            "Scanning mods",
+            lambda: self._populate_mod_list(previously_selected),
+        )
+    
+    def _populate_mod_list(self, previously_selected):
+        self._signature_cache = (None, None)
+        mods = DatabaseHandler.getRegisteredMods()
+        selected_idx = None
+        if previously_selected:
+            selected_idx = {mod.name: idx for idx, mod in enumerate(mods)}.get(previously_selected.name)
+        
+        batches = self._mod_batches(mods)
+        self._pending_mod_batch = self.after_idle(self._insert_mod_batch, batches, selected_idx)
+    
+    def _mod_batches(self, mods):
+        """Yield (first index, mods) chunks of the mod list"""
+        for start in range(0, len(mods), self.mod_list_batch_size):
+            yield start, mods[start:start + self.mod_list_batch_size]
+    
+    def _insert_mod_batch(self, batches, selected_idx):
+        """Insert the next chunk of mods into the list, then yield back to the event loop"""
+        try:
+            mod_idx, batch = next(batches)
+        except StopIteration:
+            self._pending_mod_batch = None
+            self.check_quick_launch()
+            self.showCurrentMod()
+            return
         
-        mod_idx = 0
-        for mod in DatabaseHandler.getRegisteredMods():
-            self.modList.insert(END, mod.name)
+        for mod in batch:
             mod.display_idx = mod_idx
             
-            self.update_list_style(mod)
-            if previously_selected and mod == previously_selected.name:
-                self.modList.selection_set(mod_idx)
+            self.modList.insert('', END, iid = str(mod_idx), text = mod.name, tags = (self.list_style(mod),))
+            if mod_idx == selected_idx:
+                self.modList.selection_set(str(mod_idx))
             mod_idx += 1
         
-        self.check_quick_launch()
-        self.showCurrentMod()
+        self._pending_mod_batch = self.after_idle(self._insert_mod_batch, batches, selected_idx)
+    
+    def list_style(self, mod):
+        return 'enabled' if mod.enabled else 'disabled'
     
     def update_list_style(self, mod):
-        if mod.enabled:
-            self.modList.itemconfig(mod.display_idx, foreground = 'black', selectforeground = 'white')
-        else:
-            self.modList.itemconfig(mod.display_idx, foreground = 'grey', selectforeground = 'lightgrey')
+        self.modList.item(str(mod.display_idx), tags = (self.list_style(mod),))
     
     def selected_mod(self):
-        if DatabaseHandler.getInstance().isEmpty():
+        mods = DatabaseHandler.getRegisteredMods()
+        if not mods:
             return None
-        if len(self.modList.curselection()) == 0:
-            self.modList.selection_set(0)
-            selected = 0
+        selection = self.modList.selection()
+        if selection:
+            selected = int(selection[0])
         else:
-            selected = self.modList.curselection()[0]
+            selected = 0
+            if self.modList.exists('0'):
+                self.modList.selection_set('0')
         
-        return DatabaseHandler.getRegisteredMods()[self.modList.curselection()[0]]
+        return mods[selected]
             
     def showCurrentMod(self, _arg=None):
         self.showMod(self.selected_mod())
@@ -325,6 +431,7 @@ class Window(Frame):
             mod.disable()
         else:
             mod.enable()
+        self._signature_cache = (None, None)
         
         self.update_list_style(mod)
         self.showMod(mod)
@@ -380,12 +487,21 @@ class Window(Frame):
         self.config(cursor = '')
         self.can_quit = True
     
-    background_refresh_delay = 1000
+    # only animates the launch button, completion is signaled by <<BackgroundDone>>
+    background_refresh_delay = 200
     background_thread = None
     background_finished = True
+    background_on_finished = None
+    background_refresh_job = None
+    background_error = None
     
-    def start_background_task(self, task, message):
+    def start_background_task(self, task, message, on_finished = None):
+        """Run task in a thread. on_finished is then called from the Tk thread, for UI updates.
+        
+        If task raises, on_finished is skipped and the exception is re-raised on the Tk thread."""
         self.disable_UI(message)
+        self.background_on_finished = on_finished
+        self.background_error = None
         
         ui.log.logger.backgroundState = message
         
@@ -396,25 +512,54 @@ class Window(Frame):
         def _wrapper():
             try:
                 task()
+            except Exception as ex:
+                # handed over to on_background_done, where it reaches handleException
+                self.background_error = ex
             finally:
                 self.background_finished = True
+                try:
+                    self.master.event_generate('<<BackgroundDone>>', when = 'tail')
+                except (RuntimeError, TclError):
+                    # main loop not running yet, update_background_state will notice instead
+                    pass
         
         self.background_thread = threading.Thread(target = _wrapper)
         self.background_thread.start()
-        self.after(self.background_refresh_delay, self.update_background_state)
+        self.background_refresh_job = self.after(self.background_refresh_delay, self.update_background_state)
         
     def update_background_state(self):
-        extra_label = "." * (self.background_counter % 5)
+        self.background_refresh_job = None
+        # fallback for when <<BackgroundDone>> couldn't be posted. The worker may also still be
+        # blocked posting it, which needs this thread: only finish once it has actually exited
+        if self.background_finished and not self.background_thread.is_alive():
+            self.on_background_done()
+            return
+        
+        extra_label = "." * (self.background_counter // 5 % 5)
         self.background_counter += 1
         
         self.launchButton.config(text = extra_label + " " + ui.log.logger.backgroundState + " " + extra_label)
-        if self.background_finished:
-            self.background_thread.join()
-            self.background_thread = None
-            self.enable_UI(self.launchButton_default_text)
-            self.check_quick_launch()
-        else:
-            self.after(self.background_refresh_delay, self.update_background_state)
+        self.background_refresh_job = self.after(self.background_refresh_delay, self.update_background_state)
+    
+    def on_background_done(self, _arg=None):
+        if self.background_thread is None:
+            return  # already handled
+        # from <<BackgroundDone>>, the worker's event_generate has returned and it is only exiting,
+        # from update_background_state it has already exited: join can't wait on this thread
+        if self.background_refresh_job is not None:
+            self.after_cancel(self.background_refresh_job)
+            self.background_refresh_job = None
+        
+        self.background_thread.join()
+        self.background_thread = None
+        self.enable_UI(self.launchButton_default_text)
+        self.check_quick_launch()
+        on_finished, self.background_on_finished = self.background_on_finished, None
+        error, self.background_error = self.background_error, None
+        if error is not None:
+            raise error
+        if on_finished:
+            on_finished()
     
     def _core_extract_path(self):
         return os.path.join(self.modPath[0], "spacehaven_" + self.gameInfo.version)
@@ -439,17 +584,30 @@ class Window(Frame):
     def mods_enabled(self):
         return DatabaseHandler.getActiveMods()
     
+    _signature_cache = (None, None)
+    
     def current_mods_signature(self):
-        import hashlib
+        cache_key = (
+            tuple((mod.name, mod.version, mod.enabled) for mod in DatabaseHandler.getRegisteredMods()),
+            self.gameInfo.version,
+        )
+        if self._signature_cache[0] == cache_key:
+            return self._signature_cache[1]
         
-        mods_signature = ["spacehaven", self.gameInfo.version]
+        # same digest as md5("spacehaven__<game version>__<mod name>__<mod version>...".lower()),
+        # fed field by field, so existing quicklaunch files stay valid
+        digest = hashlib.md5(b"spacehaven")
+        def _feed(field):
+            digest.update(b"__")
+            digest.update(field.lower().encode('utf-8'))
+        
+        _feed(self.gameInfo.version)
         # mods are supposedly ordered alphabetically 
         for mod in self.mods_enabled():
-            mods_signature.append(mod.name)
-            mods_signature.append(mod.version or "VERSION_UNKNOWN")
-        
-        text_sig = "__".join(mods_signature).lower()
-        md5 = hashlib.md5(text_sig.encode('utf-8')).hexdigest()
+            _feed(mod.name)
+            _feed(mod.version or "VERSION_UNKNOWN")
+        md5 = digest.hexdigest()
+        self._signature_cache = (cache_key, md5)
         return md5
     
     def quick_launch_available(self):
@@ -498,7 +656,6 @@ class Window(Frame):
             # FIXME this will crash if the game restarts by itself (changing language)
             loader.load.unload(self.jarPath)
         except Exception as ex:
-            import traceback
             traceback.print_exc()
             messagebox.showerror("Error during quick launch", traceback.format_exc(3))
     
@@ -510,7 +667,6 @@ class Window(Frame):
             ui.launcher.launchAndWait(self.gamePath)
             loader.load.unload(self.jarPath)
         except Exception as ex:
-            import traceback
             traceback.print_exc()
             messagebox.showerror("Error loading mods", traceback.format_exc(3))
     
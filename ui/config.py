@@ -0,0 +1,73 @@
+
+import json
+import os
+
+import ui.log
+
+# relative to the working directory, like the legacy files it replaces
+CONFIG_FILE = "modloader_config.json"
+
+# replaced by CONFIG_FILE, only read to migrate existing installs
+LEGACY_GAME_PATH_FILE = "previous_spacehaven_path.txt"
+LEGACY_EXTRA_MODS_FILE = "extra_mods_path.txt"
+
+
+class Config:
+    """Modloader settings remembered between runs (game location, extra mod folders...)"""
+
+    def __init__(self, path=CONFIG_FILE):
+        self.path = path
+        self.gamePath = None
+        self.extraModPaths = []
+        self.steamInstallPath = None
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            self.loadLegacy()
+            return
+        except ValueError:
+            ui.log.log("Unable to read {}, ignoring it.".format(self.path))
+            return
+        if not isinstance(data, dict):
+            ui.log.log("Unexpected content in {}, ignoring it.".format(self.path))
+            return
+
+        def _path(key):
+            value = data.get(key)
+            return value if isinstance(value, str) and value else None
+
+        self.gamePath = _path("gamePath")
+        extraModPaths = data.get("extraModPaths")
+        if isinstance(extraModPaths, list):
+            self.extraModPaths = [path for path in extraModPaths if isinstance(path, str) and path.strip()]
+        self.steamInstallPath = _path("steamInstallPath")
+
+    def loadLegacy(self):
+        """Read the settings from the text files used by previous versions"""
+        try:
+            with open(LEGACY_GAME_PATH_FILE, 'r') as f:
+                self.gamePath = f.read() or None
+        except OSError:
+            pass
+
+        try:
+            with open(LEGACY_EXTRA_MODS_FILE, 'r') as f:
+                self.extraModPaths = [path.strip() for path in f.read().split('\n') if path.strip()]
+        except OSError:
+            pass
+
+    def save(self):
+        data = {
+            "gamePath": self.gamePath,
+            "extraModPaths": self.extraModPaths,
+            "steamInstallPath": self.steamInstallPath,
+        }
+        # write to a temporary file first so a crash can't leave a truncated config behind
+        tmpPath = self.path + ".tmp"
+        with open(tmpPath, 'w') as f:
+            json.dump(data, f, indent=4)
+        os.replace(tmpPath, self.path)
@@ -1,7 +1,9 @@
 
 from __future__ import annotations  # Required to annotate ModDatabase.getInstance() with own type
-import distutils.version
+import concurrent.futures
 import os
+import pathlib
+import re
 from xml.etree import ElementTree
 
 import version
@@ -15,45 +17,83 @@ class ModDatabase:
     __lastInstance = None
     Prefixes = {}
     mods: list[Mod]
+    # info file path -> ((st_mtime_ns, st_size), Mod), kept for the lifetime of the app
+    _modCache: dict[str, tuple[tuple[int, int], Mod]] = {}
 
     def __init__(self, path_list, gameInfo):
         self.path_list = path_list
         self.gameInfo = gameInfo
         self.mods = []
+        self._byPath = {}
         ModDatabase.__lastInstance = self
 
     def locateMods(self):
-        self.mods = []
-        ModDatabase.Prefixes = {}
-
         ui.log.log("Locating mods...")
+        infoFiles = []
         for path in self.path_list:
-            for modFolder in os.listdir(path):
-                if 'spacehaven' in modFolder:
-                    continue  # don't need to load core game definitions
-                modPath = os.path.join(path, modFolder)
-                if os.path.isfile(modPath):
-                    # TODO add support for zip files ? unzip them on the fly ?
-                    continue  # don't load logs, prefs, etc
-                
-                # TODO Pass the mod path to Mod() instead of the info_file and let it handle
-                # the info file check. It already does this! Let it do its job!
-                info_file = os.path.join(modPath, "info")
-                if not os.path.isfile(info_file):
-                    info_file += '.xml'
-                if not os.path.isfile(info_file):
-                    # no info file, don't create a mod.
-                    continue
-
-                newMod = Mod(info_file, self.gameInfo)
-                if newMod.prefix:
-                    if newMod.prefix in ModDatabase.Prefixes and ModDatabase.Prefixes[newMod.prefix]:
-                        ui.log.log(f"  Warning: Mod prefix {newMod.prefix} for mod {newMod.title()} is already in use.")
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if not entry.is_dir():
+                        # TODO add support for zip files ? unzip them on the fly ?
+                        continue  # don't load logs, prefs, etc
+                    if 'spacehaven' in entry.name:
+                        continue  # don't need to load core game definitions
+
+                    # TODO Pass the mod path to Mod() instead of the info_file and let it handle
+                    # the info file check. It already does this! Let it do its job!
+                    try:
+                        with os.scandir(entry.path) as modEntries:
+                            names = {modEntry.name for modEntry in modEntries if modEntry.is_file()}
+                    except OSError:
+                        continue  # unreadable folder, skip it like a folder without info file
+                    if "info" in names:
+                        info_file = os.path.join(entry.path, "info")
+                    elif "info.xml" in names:
+                        info_file = os.path.join(entry.path, "info.xml")
                     else:
-                        ModDatabase.Prefixes[newMod.prefix] = newMod.enabled
-                self.mods.append(newMod)
+                        # no info file, don't create a mod.
+                        continue
+                    infoFiles.append(info_file)
+
+        # overlaps the file I/O of cache misses (stat, open, read release the GIL), which helps
+        # on slow or network drives; expat itself holds the GIL, so parsing isn't any faster
+        mods = []
+        if infoFiles:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(8, len(infoFiles))) as executor:
+                mods = list(executor.map(self._loadMod, infoFiles))
+        # mods buffer their log lines while loading, write them in discovery order
+        for newMod in mods:
+            newMod.flushLog()
+
+        # prefixes are registered in discovery order, after all the mods are loaded
+        ModDatabase.Prefixes = {}
+        for newMod in mods:
+            if newMod.prefix:
+                if newMod.prefix in ModDatabase.Prefixes and ModDatabase.Prefixes[newMod.prefix]:
+                    ui.log.log(f"  Warning: Mod prefix {newMod.prefix} for mod {newMod.title()} is already in use.")
+                else:
+                    ModDatabase.Prefixes[newMod.prefix] = newMod.enabled
         
-        self.mods.sort(key=lambda mod: mod.name)
+        mods.sort(key=lambda mod: mod.name)
+        self.mods = mods
+        # Mod.path is already normalized
+        self._byPath = {mod.path: mod for mod in mods}
+
+    def _loadMod(self, info_file) -> Mod:
+        """Return the Mod for an info file, only parsing it again if it changed on disk."""
+        st = os.stat(info_file)
+        statKey = (st.st_mtime_ns, st.st_size)
+        cached = ModDatabase._modCache.get(info_file)
+        if cached and cached[0] == statKey and cached[1].gameInfo is self.gameInfo:
+            mod = cached[1]
+            mod.log("  Reusing cached mod at {}".format(mod.path))
+            mod.enabled = not os.path.isfile(os.path.join(mod.path, DISABLED_MARKER))
+            mod._mappedIDs = []
+            return mod
+
+        mod = Mod(info_file, self.gameInfo)
+        ModDatabase._modCache[info_file] = (statKey, mod)
+        return mod
 
     def isEmpty(self) -> bool:
         return not len(self.mods)
@@ -81,9 +121,7 @@ class ModDatabase:
     @classmethod
     def getMod(cls, modPath) -> Mod:
         """Get a specific mod from its installation path."""
-        for mod in cls.getInstance().mods:
-            if mod.path == modPath:
-                return mod
+        return cls.getInstance()._byPath.get(os.path.normpath(modPath))
 
     @classmethod
     def getInstance(cls) -> ModDatabase:
@@ -92,13 +130,32 @@ class ModDatabase:
             raise Exception("Mod Database not ready.")
         return cls.__lastInstance
 
+# same syntax as distutils' StrictVersion: "1.0", "1.0.2", "1.0b1", "1.0.2a3"
+VERSION_PATTERN = re.compile(r"(\d+)\.(\d+)(?:\.(\d+))?(?:([ab])(\d+))?")
+
+def parseVersion(versionString) -> tuple:
+    """Parse a version ("0.9.1", "0.9.1b1") into a tuple that compares like StrictVersion"""
+    match = VERSION_PATTERN.fullmatch(versionString.strip())
+    if not match:
+        raise ValueError("invalid version number '{}'".format(versionString))
+    major, minor, patch, prerelease, prereleaseNumber = match.groups()
+    # "1.0" == "1.0.0", and pre-releases come before the release: 1.0a1 < 1.0b1 < 1.0
+    if prerelease:
+        prereleaseKey = (0, prerelease, int(prereleaseNumber))
+    else:
+        prereleaseKey = (1, "", 0)
+    return (int(major), int(minor), int(patch or 0), prereleaseKey)
+
+LOADER_VERSION = parseVersion(version.version)
+
 DISABLED_MARKER = "disabled.txt"
 class Mod:
     """Details about a specific mod (name, description)"""
 
     def __init__(self, info_file, gameInfo):
         self.path = os.path.normpath(os.path.dirname(info_file))
-        ui.log.log("  Loading mod at {}...".format(self.path))
+        self.pendingLog = []
+        self.log("  Loading mod at {}...".format(self.path))
         
         # TODO add a flag to warn users about savegame compatibility ?
         self.name = os.path.basename(self.path)
@@ -110,7 +167,7 @@ class Mod:
     def loadInfo(self, infoFile):
         
         if not os.path.exists(infoFile):
-            ui.log.log("    No info file present")
+            self.log("    No info file present")
             self.name += " [!]"
             self.description = "Error loading mod: no info file present. Please create one."
             return
@@ -119,17 +176,22 @@ class Mod:
             return elt.text.strip("\r\n\t ")
         
         def _optional(tag):
-            try:
-                return _sanitize(mod.find(tag))
-            except:
+            elt = children.get(tag)
+            if elt is None or elt.text is None:
                 return ""
+            return _sanitize(elt)
         
         try:
-            info = ElementTree.parse(infoFile)
-            mod = info.getroot()
+            # info files are tiny, parsing the bytes directly is cheaper than ElementTree.parse()
+            with open(infoFile, 'rb') as f:
+                mod = ElementTree.fromstring(f.read())
+            # index the top-level tags once instead of a find() scan per tag, first one wins like find()
+            children = {}
+            for child in mod:
+                children.setdefault(child.tag, child)
 
-            self.name = _sanitize(mod.find("name"))
-            self.description = _sanitize(mod.find("description"))
+            self.name = _sanitize(children.get("name"))
+            self.description = _sanitize(children.get("description"))
             
             self.known_issues = _optional("knownIssues")
             self.version = _optional("version")
@@ -145,9 +207,9 @@ class Mod:
             print(ex)
             self.name += " [!]"
             self.description = "Error loading mod: error parsing info file."
-            ui.log.log("    Failed to parse info file")
+            self.log("    Failed to parse info file")
 
-        ui.log.log("    Finished loading {}".format(self.name))
+        self.log("    Finished loading {}".format(self.name))
     
     def enable(self):
         try:
@@ -157,8 +219,8 @@ class Mod:
             pass
     
     def disable(self):
-        with open(os.path.join(self.path, DISABLED_MARKER), "w") as marker:
-            marker.write("this mod is disabled, remove this file to enable it again (or toggle it via the modloader UI)")
+        # only the existence of the marker matters, its name says what it does
+        pathlib.Path(self.path, DISABLED_MARKER).touch()
         self.enabled = False
     
     def title(self):
@@ -195,10 +257,15 @@ class Mod:
 
     def verifyLoaderVersion(self, mod):
         self.minimumLoaderVersion = mod.find("minimumLoaderVersion").text
-        if distutils.version.StrictVersion(self.minimumLoaderVersion) > distutils.version.StrictVersion(version.version):
+        try:
+            minimumVersion = parseVersion(self.minimumLoaderVersion)
+        except ValueError:
+            self.warn("Invalid minimum loader version {}".format(self.minimumLoaderVersion))
+            return
+        if minimumVersion > LOADER_VERSION:
             self.warn("Mod loader version {} is required".format(self.minimumLoaderVersion))
 
-        ui.log.log("    Minimum Loader Version: {}".format(self.minimumLoaderVersion))
+        self.log("    Minimum Loader Version: {}".format(self.minimumLoaderVersion))
 
     def verifyGameVersion(self, mod, gameInfo):
         # FIXME disabled ATM as this check doesn't work
@@ -213,7 +280,7 @@ class Mod:
         for version in list(gameVersionsTag):
             self.gameVersions.append(version.text)
 
-        ui.log.log("    Game Versions: {}".format(", ".join(self.gameVersions)))
+        self.log("    Game Versions: {}".format(", ".join(self.gameVersions)))
 
         if not gameInfo.version:
             self.warn("Could not determine Space Haven version. You might need to update your loader.")
@@ -225,7 +292,16 @@ class Mod:
                 ", ".join(self.gameVersions)
             ))
 
+    def log(self, message):
+        """Buffer a log line until flushLog(), mods loaded in parallel would mix up their lines otherwise"""
+        self.pendingLog.append(message)
+
+    def flushLog(self):
+        for message in self.pendingLog:
+            ui.log.log(message)
+        self.pendingLog = []
+
     def warn(self, message):
-        ui.log.log("    Warning: {}".format(message))
+        self.log("    Warning: {}".format(message))
         self.name += " [!]"
         self.description += "\nWARNING: {}!".format(message)